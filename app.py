@@ -1,12 +1,14 @@
 from flask import Flask, request, jsonify, render_template
-import re
 from supabase import create_client, Client
 from datetime import datetime
 from dotenv import load_dotenv
+import atexit
 import os
+import queue
 import sys
-from payment_verification import verify_payment
-from ml_classifier import classify_sms
+import threading
+from payment_verification import verify_payment, _fetch_txn, tune_http_pool
+from ml_classifier import parse_sms
 
 #  CONFIG for supabase keys
 load_dotenv()
@@ -21,46 +23,63 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 # --- INIT ---
 app = Flask(__name__)
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+tune_http_pool(supabase)
 
-# --- REGEX PATTERNS ---
-NAME_PATTERN = r"Name[:\s]+([A-Za-z ]+)"
-AMOUNT_PATTERN = r"Amount[:\s]+([\d,.]+)"
-ACCOUNT_PATTERN = r"Account(?: No\.| Number)[:\s]+(\d+)"
+# --- BACKGROUND INSERT QUEUE ---
+# Incoming SMS rows are queued and flushed in batches by a daemon
+# thread, so /receive-sms no longer blocks on a Supabase round-trip
+# per message
+INSERT_BATCH_SIZE = 50
+INSERT_FLUSH_INTERVAL = 0.5  # seconds to wait for a first queued row
+
+_insert_queue = queue.Queue()
+
+def _insert_batch(batch):
+    try:
+        supabase.table(TABLE_NAME).insert(batch).execute()
+    except Exception as e:
+        # Payment data must not be lost with the batch: retry row by
+        # row so one bad row cannot sink the other 49
+        print(f"Error: failed to insert batch of {len(batch)} messages, "
+              f"retrying individually: {e}")
+        for row in batch:
+            try:
+                supabase.table(TABLE_NAME).insert(row).execute()
+            except Exception as row_error:
+                print(f"Error: dropping message txid={row.get('txid')!r}: {row_error}")
+    # New rows may supersede cached verification lookups
+    _fetch_txn.cache_clear()
+
+def _insert_worker():
+    while True:
+        try:
+            batch = [_insert_queue.get(timeout=INSERT_FLUSH_INTERVAL)]
+        except queue.Empty:
+            continue
+        while len(batch) < INSERT_BATCH_SIZE:
+            try:
+                batch.append(_insert_queue.get_nowait())
+            except queue.Empty:
+                break
+        _insert_batch(batch)
+
+def _flush_insert_queue():
+    """Drain anything still queued (called on shutdown)"""
+    batch = []
+    while True:
+        try:
+            batch.append(_insert_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _insert_batch(batch)
+
+threading.Thread(target=_insert_worker, daemon=True).start()
+atexit.register(_flush_insert_queue)
 
 def extract_fields(text):
-    # TxId
-    txid = ''
-    txid_match = re.search(r'TxId[:\s]*([\d]+)', text)
-    if not txid_match:
-        txid_match = re.search(r'\*161\*TxId:([\d]+)\*R\*', text)
-    if txid_match:
-        txid = txid_match.group(1)
-
-    # Amount
-    amount = ''
-    amount_match = re.search(r'(\d{1,3}(?:,\d{3})*|\d+)\s*RWF', text)
-    if amount_match:
-        amount = amount_match.group(0)
-
-    # Sender name
-    sender_name = ''
-    sender_match = re.search(r'from ([A-Za-z ]+) \(', text)
-    if sender_match:
-        sender_name = sender_match.group(1).strip()
-
-    # Timestamp
-    timestamp = ''
-    timestamp_match = re.search(r'at (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', text)
-    if timestamp_match:
-        timestamp = timestamp_match.group(1)
-
-    return {
-        'raw_text': text,
-        'txid': txid or '',
-        'amount': amount or '',
-        'sender_name': sender_name or '',
-        'timestamp': timestamp or None
-    }
+    # Thin shim over the fused single-pass parser in ml_classifier
+    return parse_sms(text)['fields']
 
 # --- ROUTES ---
 @app.route('/receive-sms', methods=['POST'])
@@ -68,9 +87,10 @@ def receive_sms():
     data = request.get_json()
     message = data.get('message', '')
 
-    # Use ML classifier to determine if this is a payment SMS
-    classification = classify_sms(message)
-    
+    # Single fused pass extracts fields and classifies the SMS
+    parsed = parse_sms(message)
+    classification = parsed['classification']
+
     if not classification['is_payment_sms']:
         return jsonify({
             "status": "ignored", 
@@ -86,18 +106,25 @@ def receive_sms():
             "confidence": classification['confidence']
         })
 
-    # Extract fields and store with ML-extracted info
-    fields = extract_fields(message)
-    
-    # Add ML-extracted information
+    # Store the already-extracted fields with ML-extracted info
+    fields = parsed['fields']
+
+    # Add ML-extracted information. sender_phone_digits is always set
+    # so every queued row has the same key set; PostgREST rejects bulk
+    # inserts whose objects have mismatched keys
     ml_info = classification['payment_info']
-    if ml_info['phone_digits']:
-        fields['sender_phone_digits'] = ml_info['phone_digits']
-    
+    fields['sender_phone_digits'] = ml_info['phone_digits'] or None
+
     fields['ml_confidence'] = classification['confidence']
     fields['payment_status'] = classification['status']
     
-    supabase.table(TABLE_NAME).insert(fields).execute()
+    # Queue for batched insert; ?sync=1 keeps the old blocking insert
+    # around for debugging
+    if request.args.get('sync'):
+        supabase.table(TABLE_NAME).insert(fields).execute()
+        _fetch_txn.cache_clear()
+    else:
+        _insert_queue.put_nowait(fields)
     return jsonify({
         "status": "saved", 
         "data": fields,
@@ -142,7 +169,9 @@ def index():
     })
 
 if __name__ == '__main__':
-    # Get port from environment variable for deployment
+    # Local development only. In production run under gunicorn so
+    # request handling parallelizes across workers and threads:
+    #   gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:$PORT app:app
     port = int(os.environ.get('PORT', 5000))
     # Bind to 0.0.0.0 for external access
     app.run(host='0.0.0.0', port=port, debug=False)
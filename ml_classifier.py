@@ -7,10 +7,35 @@ SMS messages and determine if they indicate successful payments.
 import re
 from typing import Dict, List, Tuple
 
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - optional C extension
+    ahocorasick = None
+
+try:
+    import hyperscan
+except ImportError:  # pragma: no cover - optional C extension
+    hyperscan = None
+
 
 class PaymentSMSClassifier:
     """Lightweight classifier for determining if SMS indicates successful payment"""
-    
+
+    # Fixed attribute set: skips the per-instance __dict__ and its
+    # hashed attribute lookups on the per-request path
+    __slots__ = ('payment_success_keywords', 'payment_failure_keywords',
+                 'momo_patterns', '_any_keyword_re', '_momo_re',
+                 '_momo_db', '_parse_re', '_keyword_ac',
+                 '_success_set', '_failure_set')
+
+    # Extraction patterns compiled once so per-message calls skip re's
+    # pattern-cache lookup
+    _TXID_RE = re.compile(r'TxId[:\s]*(\d+)', re.IGNORECASE)
+    _AMOUNT_RE = re.compile(r'(\d+(?:,\d{3})*)\s*RWF')
+    _SENDER_RE = re.compile(r'from ([A-Za-z\s]+)\s*\(')
+    _PHONE_RE = re.compile(r'\(\*+(\d{2,3})\)')
+    _TOKEN_RE = re.compile(r'\w+')
+
     def __init__(self):
         # Keywords that typically indicate successful payment
         self.payment_success_keywords = [
@@ -25,19 +50,268 @@ class PaymentSMSClassifier:
         ]
         
         # Patterns for Rwandan MoMo SMS formats
-        self.momo_patterns = [
+        raw_momo_patterns = (
             r'\*161\*TxId:\d+\*R\*',  # Standard MoMo format
             r'You have received \d+ RWF',  # Receive confirmation
             r'You have sent \d+ RWF',      # Send confirmation
+        )
+        self.momo_patterns = [
+            re.compile(p, re.IGNORECASE) for p in raw_momo_patterns
         ]
+
+        # Either keyword class; lets is_payment_related stop at the
+        # first hit instead of counting every match
+        self._any_keyword_re = re.compile(
+            r'\b(' + '|'.join(map(re.escape,
+                                  self.payment_success_keywords
+                                  + self.payment_failure_keywords)) + r')\b',
+            re.IGNORECASE)
+        self._momo_re = re.compile(
+            '|'.join('(?:' + p + ')' for p in raw_momo_patterns),
+            re.IGNORECASE)
+
+        # Hyperscan DFA matching all MoMo patterns simultaneously in one
+        # linear pass; falls back to the fused re alternation when the
+        # hyperscan bindings are unavailable
+        if hyperscan is not None:
+            self._momo_db = hyperscan.Database()
+            self._momo_db.compile(
+                expressions=[p.encode() for p in raw_momo_patterns],
+                ids=list(range(len(raw_momo_patterns))),
+                flags=[hyperscan.HS_FLAG_CASELESS] * len(raw_momo_patterns))
+        else:
+            self._momo_db = None
+
+        # Fused field extractor: every field the platform stores as one
+        # alternation, walked once per SMS via finditer instead of one
+        # scan per extraction regex. Keywords are counted separately by
+        # _count_keywords — a consumed span (e.g. a sender name) must
+        # not swallow keyword hits inside it. Case-insensitivity is
+        # scoped to the TxId branches; the other literals (RWF, from,
+        # at) stay case-sensitive as they always were.
+        self._parse_re = re.compile(
+            r'(?i:\*161\*TxId:(?P<star_txid>\d+)\*R\*)'
+            r'|(?i:TxId[:\s]*(?P<txid>\d+))'
+            r'|at (?P<timestamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})'
+            r'|from (?P<sender>[A-Za-z ]+)(?=\()'
+            r'|\(\*+(?P<phone>\d{2,3})\)'
+            r'|(?P<amount>\d+(?:,\d{3})*)\s*RWF')
+
+        # Aho-Corasick automaton over all keywords: one O(n) pass per SMS
+        # instead of one regex scan per keyword class. Falls back to the
+        # alternation regexes when pyahocorasick is unavailable.
+        # Frozensets for the tokenized fallback path: one tokenize pass
+        # plus O(1) membership probes instead of per-keyword scans
+        self._success_set = frozenset(self.payment_success_keywords)
+        self._failure_set = frozenset(self.payment_failure_keywords)
+
+        if ahocorasick is not None:
+            self._keyword_ac = ahocorasick.Automaton()
+            for keyword in self.payment_success_keywords:
+                self._keyword_ac.add_word(keyword, ('success', keyword))
+            for keyword in self.payment_failure_keywords:
+                self._keyword_ac.add_word(keyword, ('failure', keyword))
+            self._keyword_ac.make_automaton()
+        else:
+            self._keyword_ac = None
+
+    # Fixed literal opening of the standard MoMo format; `in`/find use
+    # CPython's vectorized substring search, far cheaper than regex
+    _MOMO_MARKER = '*161*TxId:'
+
+    def _momo_hit(self, sms_text: str) -> bool:
+        """Check all MoMo patterns in one pass, stopping at the first hit"""
+        # Fast path: literal marker plus a cheap digit-span check covers
+        # the dominant '*161*TxId:<digits>*R*' format
+        idx = sms_text.find(self._MOMO_MARKER)
+        if idx != -1:
+            rest = sms_text[idx + len(self._MOMO_MARKER):]
+            digits = 0
+            while digits < len(rest) and rest[digits].isdigit():
+                digits += 1
+            if digits and rest[digits:digits + 3] == '*R*':
+                return True
+
+        if self._momo_db is None:
+            return self._momo_re.search(sms_text) is not None
+
+        found = False
+
+        def on_match(pattern_id, start, end, flags, context):
+            nonlocal found
+            found = True
+            return True  # terminate the scan on the first match
+
+        try:
+            self._momo_db.scan(sms_text.encode('utf-8', 'replace'),
+                               match_event_handler=on_match)
+        except hyperscan.ScanTerminated:
+            pass
+        return found
+
+    def _scan(self, sms_text: str,
+              text_lower: str = None) -> Tuple[bool, int, int]:
+        """
+        Scan the SMS once and return everything the classifier needs
+
+        Args:
+            sms_text: SMS message text
+            text_lower: Lowercased copy, if the caller already has one,
+                so the allocation isn't repeated per call
+
+        Returns:
+            Tuple of (momo_pattern_hit, success_keyword_count,
+            failure_keyword_count)
+        """
+        if text_lower is None:
+            text_lower = sms_text.lower()
+        momo_hit = self._momo_hit(sms_text)
+        success_count, failure_count = self._count_keywords(text_lower)
+        return momo_hit, success_count, failure_count
+
+    @staticmethod
+    def _status_from_scan(scan: Tuple[bool, int, int]) -> str:
+        """Derive the payment status from a _scan result"""
+        momo_hit, success_count, failure_count = scan
+        if not (momo_hit or success_count or failure_count):
+            return 'unknown'
+        # Failure indicators win over success indicators
+        if failure_count:
+            return 'failed'
+        if success_count:
+            return 'success'
+        return 'unknown'
+
+    @staticmethod
+    def _confidence_from_scan(scan: Tuple[bool, int, int]) -> float:
+        """Derive the confidence score from a _scan result"""
+        momo_hit, success_count, failure_count = scan
+        # MoMo pattern match gives high confidence
+        total_score = 0.7 if momo_hit else 0.0
+        # Add confidence based on keyword matches
+        total_score += min(0.3, (success_count + failure_count) * 0.1)
+        return min(1.0, total_score)
+
+    @staticmethod
+    def _is_word_char(ch: str) -> bool:
+        """Same word-character definition as regex \\b"""
+        return ch.isalnum() or ch == '_'
+
+    def _count_keywords(self, text_lower: str) -> Tuple[int, int]:
+        """Count success/failure keyword hits in one pass over the text"""
+        if self._keyword_ac is None:
+            # Tokenize once and probe the keyword sets; hash lookups
+            # replace one scan per keyword, and \w+ tokens give the
+            # same \b boundaries as the automaton path
+            tokens = self._TOKEN_RE.findall(text_lower)
+            return (sum(1 for token in tokens if token in self._success_set),
+                    sum(1 for token in tokens if token in self._failure_set))
+
+        success_count = 0
+        failure_count = 0
+        for end, (category, keyword) in self._keyword_ac.iter(text_lower):
+            # Reject hits inside longer words, using the same \b
+            # semantics as _any_keyword_re so every keyword path agrees
+            start = end - len(keyword) + 1
+            if start > 0 and self._is_word_char(text_lower[start - 1]):
+                continue
+            if end + 1 < len(text_lower) and self._is_word_char(text_lower[end + 1]):
+                continue
+            if category == 'success':
+                success_count += 1
+            else:
+                failure_count += 1
+        return success_count, failure_count
     
-    def extract_payment_info(self, sms_text: str) -> Dict[str, str]:
+    def parse(self, sms_text: str) -> Dict[str, any]:
+        """
+        Extract all fields and classify the SMS in a single pass
+
+        Args:
+            sms_text: Raw SMS message text
+
+        Returns:
+            Dictionary with 'fields' (the row shape stored in the
+            Messages table) and 'classification' (same shape as
+            classify_sms)
+        """
+        txid = ''
+        amount = ''          # bare number, e.g. '7,000'
+        amount_display = ''  # as matched, e.g. '7,000 RWF'
+        amount_rwf = None
+        sender_name = ''
+        phone_digits = ''
+        timestamp = ''
+
+        # Literal prefix fast path: the standard format opens with the
+        # marker, so slice the TxId out before walking the message
+        if sms_text.startswith(self._MOMO_MARKER):
+            candidate = sms_text[len(self._MOMO_MARKER):].split('*', 1)[0]
+            if candidate.isdigit():
+                txid = candidate
+
+        # One walk over the message; first match wins per field
+        for match in self._parse_re.finditer(sms_text):
+            kind = match.lastgroup
+            if kind in ('star_txid', 'txid'):
+                if not txid:
+                    txid = match.group(kind)
+            elif kind == 'amount':
+                if not amount:
+                    amount = match.group('amount')
+                    amount_display = match.group(0)
+                    amount_rwf = int(amount.replace(',', ''))
+            elif kind == 'sender':
+                if not sender_name:
+                    sender_name = match.group('sender').strip()
+            elif kind == 'phone':
+                if not phone_digits:
+                    phone_digits = match.group('phone')
+            elif kind == 'timestamp':
+                if not timestamp:
+                    timestamp = match.group('timestamp')
+
+        # Keywords are counted over the whole text so hits inside spans
+        # the field regex consumed (e.g. a sender name) still register
+        momo_hit = self._momo_hit(sms_text)
+        success_count, failure_count = self._count_keywords(sms_text.lower())
+        scan = (momo_hit, success_count, failure_count)
+        is_payment = momo_hit or success_count > 0 or failure_count > 0
+
+        payment_info = {
+            'txid': txid if is_payment else '',
+            'amount': amount if is_payment else '',
+            'sender_name': sender_name if is_payment else '',
+            'phone_digits': phone_digits if is_payment else '',
+            'is_payment_sms': is_payment
+        }
+        classification = {
+            'payment_info': payment_info,
+            'status': self._status_from_scan(scan),
+            'confidence': (self._confidence_from_scan(scan)
+                           if sms_text.strip() else 0.0),
+            'is_payment_sms': is_payment
+        }
+        fields = {
+            'raw_text': sms_text,
+            'txid': txid,
+            'amount': amount_display,
+            'amount_rwf': amount_rwf,
+            'sender_name': sender_name,
+            'timestamp': timestamp or None
+        }
+        return {'fields': fields, 'classification': classification}
+
+    def extract_payment_info(self, sms_text: str,
+                             is_payment_sms: bool = None) -> Dict[str, str]:
         """
         Extract key payment information from SMS text
-        
+
         Args:
             sms_text: Raw SMS message text
-            
+            is_payment_sms: Precomputed classification, to avoid
+                re-scanning when the caller already ran _scan
+
         Returns:
             Dictionary containing extracted payment information
         """
@@ -48,30 +322,32 @@ class PaymentSMSClassifier:
             'phone_digits': '',
             'is_payment_sms': False
         }
-        
+
         # Check if this looks like a payment SMS
-        info['is_payment_sms'] = self.is_payment_related(sms_text)
-        
+        if is_payment_sms is None:
+            is_payment_sms = self.is_payment_related(sms_text)
+        info['is_payment_sms'] = is_payment_sms
+
         if not info['is_payment_sms']:
             return info
         
         # Extract TxId
-        txid_match = re.search(r'TxId[:\s]*(\d+)', sms_text, re.IGNORECASE)
+        txid_match = self._TXID_RE.search(sms_text)
         if txid_match:
             info['txid'] = txid_match.group(1)
-        
+
         # Extract amount in RWF
-        amount_match = re.search(r'(\d{1,3}(?:,\d{3})*|\d+)\s*RWF', sms_text)
+        amount_match = self._AMOUNT_RE.search(sms_text)
         if amount_match:
             info['amount'] = amount_match.group(1)
-        
+
         # Extract sender name
-        sender_match = re.search(r'from ([A-Za-z\s]+)\s*\(', sms_text)
+        sender_match = self._SENDER_RE.search(sms_text)
         if sender_match:
             info['sender_name'] = sender_match.group(1).strip()
-        
+
         # Extract partial phone number (last few digits shown in SMS)
-        phone_match = re.search(r'\(\*+(\d{2,3})\)', sms_text)
+        phone_match = self._PHONE_RE.search(sms_text)
         if phone_match:
             info['phone_digits'] = phone_match.group(1)
         
@@ -87,21 +363,11 @@ class PaymentSMSClassifier:
         Returns:
             Boolean indicating if SMS is payment-related
         """
-        text_lower = sms_text.lower()
-        
-        # Check for MoMo patterns
-        for pattern in self.momo_patterns:
-            if re.search(pattern, sms_text, re.IGNORECASE):
-                return True
-        
-        # Check for payment keywords
-        success_score = sum(1 for keyword in self.payment_success_keywords 
-                          if keyword in text_lower)
-        failure_score = sum(1 for keyword in self.payment_failure_keywords 
-                          if keyword in text_lower)
-        
-        # Consider it payment-related if it has payment keywords
-        return success_score > 0 or failure_score > 0
+        # Short-circuit on the first MoMo or keyword hit; no need to
+        # count every match just to answer a boolean
+        if self._momo_hit(sms_text):
+            return True
+        return self._any_keyword_re.search(sms_text) is not None
     
     def classify_payment_status(self, sms_text: str) -> str:
         """
@@ -113,22 +379,7 @@ class PaymentSMSClassifier:
         Returns:
             Payment status: 'success', 'failed', or 'unknown'
         """
-        if not self.is_payment_related(sms_text):
-            return 'unknown'
-        
-        text_lower = sms_text.lower()
-        
-        # Check for failure indicators first
-        for keyword in self.payment_failure_keywords:
-            if keyword in text_lower:
-                return 'failed'
-        
-        # Check for success indicators
-        for keyword in self.payment_success_keywords:
-            if keyword in text_lower:
-                return 'success'
-        
-        return 'unknown'
+        return self._status_from_scan(self._scan(sms_text))
     
     def get_confidence_score(self, sms_text: str) -> float:
         """
@@ -142,49 +393,36 @@ class PaymentSMSClassifier:
         """
         if not sms_text.strip():
             return 0.0
-        
-        text_lower = sms_text.lower()
-        total_score = 0.0
-        
-        # MoMo pattern match gives high confidence
-        for pattern in self.momo_patterns:
-            if re.search(pattern, sms_text, re.IGNORECASE):
-                total_score += 0.7
-                break
-        
-        # Keyword matches
-        success_matches = sum(1 for keyword in self.payment_success_keywords 
-                            if keyword in text_lower)
-        failure_matches = sum(1 for keyword in self.payment_failure_keywords 
-                            if keyword in text_lower)
-        
-        # Add confidence based on keyword matches
-        total_score += min(0.3, (success_matches + failure_matches) * 0.1)
-        
-        return min(1.0, total_score)
+
+        return self._confidence_from_scan(self._scan(sms_text))
 
 
 # Initialize global classifier instance
 classifier = PaymentSMSClassifier()
 
 
+def parse_sms(sms_text: str) -> Dict[str, any]:
+    """
+    Parse and classify an SMS in a single pass over the text
+
+    Args:
+        sms_text: Raw SMS message text
+
+    Returns:
+        Dictionary with 'fields' and 'classification' (see
+        PaymentSMSClassifier.parse)
+    """
+    return classifier.parse(sms_text)
+
+
 def classify_sms(sms_text: str) -> Dict[str, any]:
     """
     Convenience function to classify SMS and extract payment info
-    
+
     Args:
         sms_text: Raw SMS message text
-        
+
     Returns:
         Dictionary with classification results and extracted info
     """
-    payment_info = classifier.extract_payment_info(sms_text)
-    status = classifier.classify_payment_status(sms_text)
-    confidence = classifier.get_confidence_score(sms_text)
-    
-    return {
-        'payment_info': payment_info,
-        'status': status,
-        'confidence': confidence,
-        'is_payment_sms': payment_info['is_payment_sms']
-    }
+    return classifier.parse(sms_text)['classification']
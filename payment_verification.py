@@ -1,29 +1,88 @@
 from supabase import create_client, Client
+import functools
 import os
-from datetime import datetime
 from dotenv import load_dotenv
+
+try:
+    from rapidfuzz import fuzz
+    from rapidfuzz.utils import default_process
+except ImportError:  # pragma: no cover - optional C extension
+    fuzz = None
+
 load_dotenv()
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set in the environment.")
 TABLE_NAME = "Messages"
-REQUIRED_AMOUNT = 100  
+REQUIRED_AMOUNT = 100
+NAME_MATCH_THRESHOLD = 85  # rapidfuzz partial_ratio score out of 100
+
+# Deletes '+', ' ' and '-' in one C-level pass instead of three
+# chained .replace() allocations
+_PHONE_STRIP = str.maketrans('', '', '+ -')
+
+def tune_http_pool(client: Client) -> None:
+    """
+    Swap the client's postgrest session for one with a larger
+    keep-alive pool and HTTP/2, so TLS sessions stay hot across
+    requests instead of being renegotiated. Best-effort: leaves the
+    stock session in place if the client internals or the h2 package
+    are unavailable.
+    """
+    try:
+        import httpx
+        session = client.postgrest.session
+        client.postgrest.session = httpx.Client(
+            base_url=session.base_url,
+            headers=session.headers,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=50,
+                                max_connections=100),
+            timeout=5.0)
+    except Exception as e:
+        print(f"Warning: could not tune Supabase HTTP pool: {e}")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+tune_http_pool(supabase)
 
-def verify_payment(txid, required_amount=REQUIRED_AMOUNT):
-    # Look up the transaction by TxID
-    db_result = supabase.table(TABLE_NAME).select('*').eq('txid', txid).execute()
+@functools.lru_cache(maxsize=4096)
+def _fetch_txn(txid):
+    """
+    Fetch and parse the transaction for a TxID, cached per TxID.
+
+    Selects only the columns verification needs and parses the amount
+    once. Raises LookupError when no row exists, so misses are never
+    cached and a later re-verification sees the row once it lands.
+    """
+    db_result = (supabase.table(TABLE_NAME)
+                 .select('txid,amount,amount_rwf,sender_name,sender_phone_digits')
+                 .eq('txid', txid).execute())
     if not db_result.data or len(db_result.data) == 0:
-        return {"status": "not_approved", "message": "Payment is not approved."}
-    
+        raise LookupError(txid)
+
     transaction = db_result.data[0]
-    # Extract amount (assume format like '7000 RWF')
-    amount_str = transaction.get('amount', '').replace(' RWF', '').replace(',', '').strip()
+    # amount_rwf is parsed on ingest; fall back to parsing the legacy
+    # 'amount' string (format like '7000 RWF') for rows that predate it
+    paid_amount = transaction.get('amount_rwf')
+    if paid_amount is None:
+        amount_str = (transaction.get('amount') or '').replace(' RWF', '').replace(',', '').strip()
+        try:
+            paid_amount = int(amount_str)
+        except Exception:
+            paid_amount = None
+    return (paid_amount,
+            transaction.get('sender_name') or '',
+            transaction.get('sender_phone_digits') or '')
+
+def verify_payment(txid, required_amount=REQUIRED_AMOUNT):
+    # Look up the transaction by TxID
     try:
-        paid_amount = int(amount_str)
-    except Exception:
+        paid_amount, _, _ = _fetch_txn(txid)
+    except LookupError:
+        return {"status": "not_approved", "message": "Payment is not approved."}
+
+    if paid_amount is None:
         return {"status": "not_approved", "message": "Payment is not approved (invalid amount format)."}
 
     if paid_amount == required_amount:
@@ -37,17 +96,13 @@ def verify_payment(txid, required_amount=REQUIRED_AMOUNT):
 def verify_payment_with_client_details(txid, client_name, client_phone, required_amount=REQUIRED_AMOUNT):
     """Verify payment using TxID, client name, and phone number matching"""
     # 1. Check payment in Messages table
-    db_result = supabase.table(TABLE_NAME).select('*').eq('txid', txid).execute()
-    if not db_result.data or len(db_result.data) == 0:
+    try:
+        paid_amount, sms_sender_name, sms_phone_digits = _fetch_txn(txid)
+    except LookupError:
         return {"status": "not_approved", "message": "Payment not found. Please check your TxID."}
 
-    transaction = db_result.data[0]
-    
     # 2. Verify amount
-    amount_str = transaction.get('amount', '').replace(' RWF', '').replace(',', '').strip()
-    try:
-        paid_amount = int(amount_str)
-    except Exception:
+    if paid_amount is None:
         return {"status": "not_approved", "message": "Invalid payment amount format."}
 
     if paid_amount < required_amount:
@@ -55,18 +110,28 @@ def verify_payment_with_client_details(txid, client_name, client_phone, required
         return {"status": "not_approved", "message": f"Insufficient payment. You are short by {shortage} RWF."}
 
     # 3. Verify client name (fuzzy matching)
-    sms_sender_name = transaction.get('sender_name', '').lower().strip()
+    sms_sender_name = sms_sender_name.lower().strip()
     client_name_lower = client_name.lower().strip()
-    
-    # Simple name matching - check if names are similar
-    if not sms_sender_name or client_name_lower not in sms_sender_name and sms_sender_name not in client_name_lower:
+
+    if not sms_sender_name:
+        return {"status": "not_approved", "message": "Name verification failed. Please ensure you entered the correct name."}
+
+    if fuzz is not None:
+        # partial_ratio tolerates abbreviations and typos the plain
+        # substring test rejects ('Jean Bosco' vs 'J. Bosco')
+        name_ok = fuzz.partial_ratio(client_name_lower, sms_sender_name,
+                                     processor=default_process) >= NAME_MATCH_THRESHOLD
+    else:
+        # Simple name matching - check if names are similar
+        name_ok = (client_name_lower in sms_sender_name
+                   or sms_sender_name in client_name_lower)
+    if not name_ok:
         return {"status": "not_approved", "message": "Name verification failed. Please ensure you entered the correct name."}
 
     # 4. Verify phone number last digits
-    client_last_digits = client_phone.replace('+', '').replace(' ', '').replace('-', '')[-3:]
+    client_last_digits = client_phone.translate(_PHONE_STRIP)[-3:]
     
     # Check if SMS contains partial phone digits
-    sms_phone_digits = transaction.get('sender_phone_digits', '')
     if sms_phone_digits:
         # Verify last 2-3 digits match
         if not client_last_digits.endswith(sms_phone_digits[-2:]):
@@ -74,13 +139,14 @@ def verify_payment_with_client_details(txid, client_name, client_phone, required
     
     # 5. Store verification in payments table
     try:
+        # created_at is filled by the column's now() default in
+        # Postgres, so no timestamp is formatted or sent per insert
         payment_record = {
             'txid': txid,
             'client_name': client_name,
             'client_phone': client_phone,
             'verified_amount': paid_amount,
-            'verification_status': 'approved',
-            'created_at': datetime.now().isoformat()
+            'verification_status': 'approved'
         }
         
         supabase.table("payments").insert(payment_record).execute()